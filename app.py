@@ -1,13 +1,54 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import (Flask, render_template, request, redirect, url_for, flash, session,
+                   abort, jsonify)
+from flask_caching import Cache
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime, date
+from sqlalchemy import and_, func, select, event as sa_event
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.hybrid import hybrid_property
+from datetime import datetime, date, timedelta
+import os
+from itertools import groupby
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'dev-secret-key'  # change to something secure
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///events.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# each server worker keeps a small pool; pre-ping replaces stale connections
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'pool_pre_ping': True,
+    # pooled connections are handed to whichever thread/greenlet needs one
+    'connect_args': {'check_same_thread': False},
+    # room for every compiled statement the app uses, so none get evicted
+    'query_cache_size': 1200,
+}
+# kept on disk so every server worker sees the same entries, and
+# invalidate_cached_views() in one worker clears them for all of them
+app.config['CACHE_TYPE'] = 'FileSystemCache'
+app.config['CACHE_DIR'] = os.path.join(app.instance_path, 'cache')
 
 db = SQLAlchemy(app)
+cache = Cache(app)
+
+
+with app.app_context():
+    @sa_event.listens_for(db.engine, "connect")
+    def set_sqlite_pragmas(dbapi_conn, connection_record):
+        """
+        Tune every new SQLite connection: WAL so readers don't block the
+        writer, fewer fsyncs per commit, a larger page cache, and enforced
+        foreign keys.
+        """
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA cache_size=-65536")  # 64 MB
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")  # 256 MB
+        cursor.execute("PRAGMA foreign_keys=ON")  # needed for ON DELETE CASCADE
+        cursor.close()
 
 
 # -------------------
@@ -16,6 +57,12 @@ db = SQLAlchemy(app)
 
 class Event(db.Model):
     __tablename__ = 'events'
+    # Overlap checks filter on the time range, so index it. create_schema()
+    # adds it to databases created before the index existed.
+    __table_args__ = (
+        db.Index('ix_event_time', 'start_time', 'end_time'),
+    )
+
     event_id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
@@ -24,12 +71,19 @@ class Event(db.Model):
 
     allocations = db.relationship('EventResourceAllocation',
                                   back_populates='event',
-                                  cascade='all, delete-orphan')
+                                  cascade='all, delete-orphan',
+                                  passive_deletes=True)
 
+    @hybrid_property
     def duration_hours(self):
         delta = self.end_time - self.start_time
         return delta.total_seconds() / 3600.0
 
+    @duration_hours.expression
+    def duration_hours(cls):
+        # same value computed in SQL, so queries can filter/sum by duration
+        return (func.julianday(cls.end_time) - func.julianday(cls.start_time)) * 24
+
 
 class Resource(db.Model):
     __tablename__ = 'resources'
@@ -39,14 +93,28 @@ class Resource(db.Model):
 
     allocations = db.relationship('EventResourceAllocation',
                                   back_populates='resource',
-                                  cascade='all, delete-orphan')
+                                  cascade='all, delete-orphan',
+                                  passive_deletes=True)
 
 
 class EventResourceAllocation(db.Model):
     __tablename__ = 'event_resource_allocations'
+    # Conflict checks look up bookings by resource and then join to the event;
+    # time-range queries on events go the other way and look up by event.
+    __table_args__ = (
+        db.Index('ix_alloc_resource', 'resource_id', 'event_id'),
+        db.Index('ix_alloc_event', 'event_id'),
+    )
+
     allocation_id = db.Column(db.Integer, primary_key=True)
-    event_id = db.Column(db.Integer, db.ForeignKey('events.event_id'), nullable=False)
-    resource_id = db.Column(db.Integer, db.ForeignKey('resources.resource_id'), nullable=False)
+    # deleting an event or resource removes its allocations in the database
+    # (see passive_deletes on the relationships)
+    event_id = db.Column(db.Integer,
+                         db.ForeignKey('events.event_id', ondelete='CASCADE'),
+                         nullable=False)
+    resource_id = db.Column(db.Integer,
+                            db.ForeignKey('resources.resource_id', ondelete='CASCADE'),
+                            nullable=False)
 
     event = db.relationship('Event', back_populates='allocations')
     resource = db.relationship('Resource', back_populates='allocations')
@@ -56,15 +124,25 @@ class EventResourceAllocation(db.Model):
 # UTILITY FUNCTIONS
 # -------------------
 
-def parse_datetime_from_form(field_name):
+def parse_event_form(form):
     """
-    HTML datetime-local gives a string like '2025-12-10T14:30'.
-    Convert to Python datetime.
+    Read the add/edit event form in one pass.
+    Returns (Event column values, list of selected resource ids as ints).
+
+    HTML datetime-local gives a string like '2025-12-10T14:30', converted
+    to Python datetime (fromisoformat is a C parser, much cheaper than
+    strptime for this fixed ISO format).
     """
-    value = request.form.get(field_name)
-    if not value:
-        return None
-    return datetime.strptime(value, "%Y-%m-%dT%H:%M")
+    start_time = form.get('start_time')
+    end_time = form.get('end_time')
+    fields = {
+        "title": form.get('title'),
+        "description": form.get('description'),
+        "start_time": datetime.fromisoformat(start_time) if start_time else None,
+        "end_time": datetime.fromisoformat(end_time) if end_time else None,
+    }
+    resource_ids = [int(rid) for rid in form.getlist('resources')]
+    return fields, resource_ids
 
 
 def check_conflicts(event, resource_ids):
@@ -81,36 +159,95 @@ def check_conflicts(event, resource_ids):
         conflicts.append("Event start time must be before end time.")
         return conflicts
 
-    for resource_id in resource_ids:
-        # For this resource, get all other events that use it
-        allocations = EventResourceAllocation.query.filter_by(resource_id=resource_id).all()
-        for alloc in allocations:
-            other_event = alloc.event
-            if other_event.event_id == event.event_id:
-                # skip self when editing
-                continue
-
-            # Overlap condition
-            if (event.start_time < other_event.end_time and
-                    event.end_time > other_event.start_time):
-                conflicts.append(
-                    f"Resource '{alloc.resource.resource_name}' "
-                    f"is already booked by event '{other_event.title}' "
-                    f"from {other_event.start_time} to {other_event.end_time}."
-                )
+    if not resource_ids:
+        return conflicts
+
+    # One query for all selected resources: join each allocation to its event
+    # and resource, and let the database apply the overlap condition. Only
+    # the columns used in the message are fetched, so no ORM objects are built.
+    rows = (db.session.query(Resource.resource_name, Event.title,
+                             Event.start_time, Event.end_time)
+            .select_from(EventResourceAllocation)
+            .join(Event, EventResourceAllocation.event_id == Event.event_id)
+            .join(Resource, EventResourceAllocation.resource_id == Resource.resource_id)
+            .filter(EventResourceAllocation.resource_id.in_(resource_ids),
+                    Event.event_id != event.event_id,  # skip self when editing
+                    Event.start_time < event.end_time,
+                    Event.end_time > event.start_time)
+            .all())
+
+    for resource_name, title, start_time, end_time in rows:
+        conflicts.append(
+            f"Resource '{resource_name}' "
+            f"is already booked by event '{title}' "
+            f"from {start_time} to {end_time}."
+        )
     return conflicts
 
 
+def has_pending_flashes():
+    """
+    Cached pages include the flash area from base.html, so don't serve or
+    store one while messages are waiting to be shown.
+    """
+    return '_flashes' in session
+
+
+def invalidate_cached_views():
+    """Drop cached pages and reports after events or resources change."""
+    cache.delete('index')
+    cache.delete_memoized(build_utilisation_report)
+
+
+def render_event_form(action, event=None, selected_resource_ids=None):
+    """
+    Render the add/edit event form. The resource list is only needed here,
+    so it is loaded for the responses that show the form and not on a
+    successful save.
+    """
+    # an event being edited may hold invalid form values; don't flush them
+    # just to load the resource list
+    with db.session.no_autoflush:
+        resources = Resource.query.all()
+    return render_template('event_form.html',
+                           action=action,
+                           resources=resources,
+                           event=event,
+                           selected_resource_ids=selected_resource_ids)
+
+
+def add_allocations(event_id, resource_ids):
+    """
+    Allocate the given resources to an event with one executemany INSERT,
+    instead of adding one ORM object per allocation.
+    """
+    if not resource_ids:
+        return
+    db.session.execute(
+        EventResourceAllocation.__table__.insert(),
+        [{"event_id": event_id, "resource_id": rid} for rid in resource_ids]
+    )
+
+
 # -------------------
 # ROUTES - HOME
 # -------------------
 
 @app.route('/')
+@cache.cached(timeout=5, key_prefix='index', unless=has_pending_flashes)
 def index():
     # small dashboard data for home page
-    upcoming_events = Event.query.order_by(Event.start_time).limit(3).all()
-    events_count = Event.query.count()
-    resources_count = Resource.query.count()
+    upcoming_events = (Event.query
+                       .options(selectinload(Event.allocations)
+                                .selectinload(EventResourceAllocation.resource))
+                       .order_by(Event.start_time)
+                       .limit(3)
+                       .all())
+    # both counts in one round-trip, as scalar subqueries of a single SELECT
+    events_count, resources_count = db.session.execute(
+        select(select(func.count(Event.event_id)).scalar_subquery(),
+               select(func.count(Resource.resource_id)).scalar_subquery())
+    ).one()
     return render_template(
         'home.html',
         upcoming_events=upcoming_events,
@@ -136,13 +273,17 @@ def add_resource():
         name = request.form.get('resource_name')
         rtype = request.form.get('resource_type')
 
+        resource = Resource(resource_name=name, resource_type=rtype)
+
         if not name or not rtype:
             flash("Resource name and type are required.", "danger")
-            return redirect(url_for('add_resource'))
+            return render_template('resource_form.html',
+                                   action="Add",
+                                   resource=resource), 400
 
-        resource = Resource(resource_name=name, resource_type=rtype)
         db.session.add(resource)
         db.session.commit()
+        invalidate_cached_views()
         flash("Resource added successfully!", "success")
         return redirect(url_for('list_resources'))
 
@@ -151,7 +292,7 @@ def add_resource():
 
 @app.route('/resources/edit/<int:resource_id>', methods=['GET', 'POST'])
 def edit_resource(resource_id):
-    resource = Resource.query.get_or_404(resource_id)
+    resource = db.session.get(Resource, resource_id) or abort(404)
 
     if request.method == 'POST':
         resource.resource_name = request.form.get('resource_name')
@@ -159,9 +300,12 @@ def edit_resource(resource_id):
 
         if not resource.resource_name or not resource.resource_type:
             flash("Resource name and type are required.", "danger")
-            return redirect(url_for('edit_resource', resource_id=resource_id))
+            return render_template('resource_form.html',
+                                   action="Edit",
+                                   resource=resource), 400
 
         db.session.commit()
+        invalidate_cached_views()
         flash("Resource updated successfully!", "success")
         return redirect(url_for('list_resources'))
 
@@ -174,102 +318,94 @@ def edit_resource(resource_id):
 
 @app.route('/events')
 def list_events():
-    events = Event.query.order_by(Event.start_time).all()
+    # the template lists each event's resources, so load them up front
+    events = (Event.query
+              .options(selectinload(Event.allocations)
+                       .selectinload(EventResourceAllocation.resource))
+              .order_by(Event.start_time)
+              .all())
     resources = Resource.query.all()
     return render_template('events.html', events=events, resources=resources)
 
 
 @app.route('/events/add', methods=['GET', 'POST'])
 def add_event():
-    resources = Resource.query.all()
     if request.method == 'POST':
-        title = request.form.get('title')
-        description = request.form.get('description')
-        start_time = parse_datetime_from_form('start_time')
-        end_time = parse_datetime_from_form('end_time')
-        selected_resource_ids = request.form.getlist('resources')  # list of strings
-
-        if not title or not start_time or not end_time:
-            flash("Title, start time, and end time are required.", "danger")
-            return redirect(url_for('add_event'))
+        fields, resource_ids = parse_event_form(request.form)
 
         # Create an unsaved Event object to run conflict checks
-        event = Event(title=title,
-                      description=description,
-                      start_time=start_time,
-                      end_time=end_time)
+        event = Event(**fields)
 
-        # Convert resource IDs to ints
-        resource_ids = [int(rid) for rid in selected_resource_ids]
+        if not event.title or not event.start_time or not event.end_time:
+            flash("Title, start time, and end time are required.", "danger")
+            return render_event_form("Add", event, resource_ids), 400
 
         # Conflict check
         conflicts = check_conflicts(event, resource_ids)
         if conflicts:
             for c in conflicts:
                 flash(c, "danger")
-            return render_template('event_form.html',
-                                   action="Add",
-                                   resources=resources,
-                                   event=event,
-                                   selected_resource_ids=resource_ids)
+            return render_event_form("Add", event, resource_ids)
 
         # Save event
         db.session.add(event)
         db.session.flush()  # get event_id before commit
 
-        for rid in resource_ids:
-            alloc = EventResourceAllocation(event_id=event.event_id, resource_id=rid)
-            db.session.add(alloc)
+        add_allocations(event.event_id, resource_ids)
 
         db.session.commit()
+        invalidate_cached_views()
         flash("Event added successfully!", "success")
         return redirect(url_for('list_events'))
 
-    return render_template('event_form.html', action="Add", resources=resources)
+    return render_event_form("Add")
 
 
 @app.route('/events/edit/<int:event_id>', methods=['GET', 'POST'])
 def edit_event(event_id):
-    event = Event.query.get_or_404(event_id)
-    resources = Resource.query.all()
+    # one SELECT for the event plus one for its allocations (needed on both
+    # GET and POST), looked up by primary key through the identity map
+    event = (db.session.get(Event, event_id,
+                            options=[selectinload(Event.allocations)])
+             or abort(404))
 
     if request.method == 'POST':
-        event.title = request.form.get('title')
-        event.description = request.form.get('description')
-        event.start_time = parse_datetime_from_form('start_time')
-        event.end_time = parse_datetime_from_form('end_time')
-        selected_resource_ids = [int(rid) for rid in request.form.getlist('resources')]
+        fields, selected_resource_ids = parse_event_form(request.form)
+        for name, value in fields.items():
+            setattr(event, name, value)
 
         if not event.title or not event.start_time or not event.end_time:
             flash("Title, start time, and end time are required.", "danger")
-            return redirect(url_for('edit_event', event_id=event_id))
+            return render_event_form("Edit", event, selected_resource_ids), 400
 
         conflicts = check_conflicts(event, selected_resource_ids)
         if conflicts:
             for c in conflicts:
                 flash(c, "danger")
-            return render_template('event_form.html',
-                                   action="Edit",
-                                   resources=resources,
-                                   event=event,
-                                   selected_resource_ids=selected_resource_ids)
-
-        # Clear old allocations and add new ones
-        EventResourceAllocation.query.filter_by(event_id=event.event_id).delete()
-        for rid in selected_resource_ids:
-            db.session.add(EventResourceAllocation(event_id=event.event_id,
-                                                   resource_id=rid))
+            return render_event_form("Edit", event, selected_resource_ids)
+
+        # Only touch the allocations that actually changed
+        old_ids = {alloc.resource_id for alloc in event.allocations}
+        new_ids = set(selected_resource_ids)
+        to_delete = old_ids - new_ids
+        to_add = new_ids - old_ids
+
+        if to_delete:
+            db.session.execute(
+                EventResourceAllocation.__table__.delete().where(and_(
+                    EventResourceAllocation.event_id == event.event_id,
+                    EventResourceAllocation.resource_id.in_(to_delete)
+                ))
+            )
+        add_allocations(event.event_id, sorted(to_add))
 
         db.session.commit()
+        invalidate_cached_views()
         flash("Event updated successfully!", "success")
         return redirect(url_for('list_events'))
 
     selected_resource_ids = [alloc.resource_id for alloc in event.allocations]
-    return render_template('event_form.html',
-                           action="Edit",
-                           resources=resources,
-                           event=event,
-                           selected_resource_ids=selected_resource_ids)
+    return render_event_form("Edit", event, selected_resource_ids)
 
 
 # -------------------
@@ -281,28 +417,29 @@ def conflict_view():
     """
     Scan all allocations and show any conflicting bookings.
     """
+    # One query, sorted by resource and then start time, so each resource's
+    # bookings can be swept in order instead of compared pairwise.
+    rows = (db.session.query(EventResourceAllocation.resource_id,
+                             Resource.resource_name, Event)
+            .join(Event, EventResourceAllocation.event_id == Event.event_id)
+            .join(Resource, EventResourceAllocation.resource_id == Resource.resource_id)
+            .order_by(EventResourceAllocation.resource_id, Event.start_time)
+            .all())
+
     conflicts = []
-    allocations = EventResourceAllocation.query.all()
-
-    # naive O(n^2) check – fine for small assignment data
-    for i in range(len(allocations)):
-        for j in range(i + 1, len(allocations)):
-            a1 = allocations[i]
-            a2 = allocations[j]
-            if a1.resource_id != a2.resource_id:
-                continue
-
-            e1 = a1.event
-            e2 = a2.event
-
-            # Overlap check
-            if (e1.start_time < e2.end_time and
-                    e1.end_time > e2.start_time):
+    for resource_id, bookings in groupby(rows, key=lambda row: row[0]):
+        active = []  # earlier bookings of this resource still running
+        for _, resource_name, event in bookings:
+            # anything that ended by this start can't overlap it or any later
+            # booking; whatever is left overlaps this one
+            active = [other for other in active if other.end_time > event.start_time]
+            for other in active:
                 conflicts.append({
-                    "resource": a1.resource.resource_name,
-                    "event1": e1,
-                    "event2": e2
+                    "resource": resource_name,
+                    "event1": other,
+                    "event2": event
                 })
+            active.append(event)
 
     return render_template('conflicts.html', conflicts=conflicts)
 
@@ -311,84 +448,171 @@ def conflict_view():
 # ROUTES - UTILISATION REPORT
 # -------------------
 
-@app.route('/report', methods=['GET', 'POST'])
-def utilisation_report():
-    resources = Resource.query.all()
-    report_data = []
-    upcoming = []
+@cache.memoize(timeout=60)
+def build_utilisation_report(start_str, end_str):
+    """
+    Build the utilisation report for a 'YYYY-MM-DD' date range as plain
+    JSON-ready data. The result only depends on the two dates (and on the
+    clock, for upcoming bookings), so it is memoized on them in the shared
+    file cache and dropped by invalidate_cached_views(), for all workers,
+    whenever events or resources change.
+    Raises ValueError for badly formatted dates.
+    """
+    start_date = datetime.strptime(start_str, "%Y-%m-%d")
+    # midnight after the last selected day, so the range is half-open
+    end_date = datetime.strptime(end_str, "%Y-%m-%d") + timedelta(days=1)
+
+    # events allocated to a resource that overlap [start_date, end_date),
+    # using the same rule as check_conflicts; start_time < end_date can
+    # range-scan ix_event_time
+    in_range = and_(Event.start_time < end_date,
+                    Event.end_time > start_date)
+
+    # Sum each resource's overlapped hours in SQL rather than loading
+    # every allocation. julianday() differences are in days.
+    overlap_hours = (func.min(func.julianday(Event.end_time), func.julianday(end_date)) -
+                     func.max(func.julianday(Event.start_time), func.julianday(start_date))) * 24
+    hours_by_resource = dict(
+        db.session.query(EventResourceAllocation.resource_id,
+                         func.sum(overlap_hours))
+        .join(Event, EventResourceAllocation.event_id == Event.event_id)
+        .filter(in_range)
+        .group_by(EventResourceAllocation.resource_id)
+        .all()
+    )
 
-    start_str = end_str = None
+    # upcoming bookings (in future from now) within the range, filtered
+    # and ordered in SQL so only future events are loaded
+    upcoming_by_resource = {}
+    upcoming_rows = (db.session.query(EventResourceAllocation.resource_id, Event)
+                     .join(Event, EventResourceAllocation.event_id == Event.event_id)
+                     .filter(in_range, Event.start_time >= datetime.now())
+                     .order_by(Event.start_time)
+                     .all())
+    for resource_id, event in upcoming_rows:
+        upcoming_by_resource.setdefault(resource_id, []).append(event)
 
-    if request.method == 'POST':
-        start_str = request.form.get('start_date')
-        end_str = request.form.get('end_date')
-
-        if not start_str or not end_str:
-            flash("Start date and end date are required.", "danger")
-            return render_template('report.html',
-                                   resources=resources,
-                                   report_data=report_data,
-                                   upcoming=upcoming,
-                                   start_date=start_str,
-                                   end_date=end_str)
-
-        start_date = datetime.strptime(start_str, "%Y-%m-%d")
-        # end of the day
-        end_date = datetime.strptime(end_str, "%Y-%m-%d")
-        end_date = datetime.combine(end_date.date(), datetime.max.time())
-
-        for resource in resources:
-            # get all events allocated to this resource that overlap range
-            allocations = resource.allocations
-            total_hours = 0.0
-            resource_upcoming = []
-
-            for alloc in allocations:
-                event = alloc.event
-                # check overlap with [start_date, end_date]
-                if event.start_time <= end_date and event.end_time >= start_date:
-                    # overlapped window
-                    overlap_start = max(event.start_time, start_date)
-                    overlap_end = min(event.end_time, end_date)
-                    if overlap_start < overlap_end:
-                        hours = (overlap_end - overlap_start).total_seconds() / 3600.0
-                        total_hours += hours
-
-                    # upcoming booking (in future from now)
-                    if event.start_time >= datetime.now():
-                        resource_upcoming.append(event)
-
-            report_data.append({
-                "resource": resource,
-                "total_hours": round(total_hours, 2),
-                "upcoming": sorted(resource_upcoming, key=lambda e: e.start_time)
+    report_data = []
+    upcoming = []
+    for resource in Resource.query.all():
+        total_hours = hours_by_resource.get(resource.resource_id) or 0.0
+        report_data.append({
+            "resource_id": resource.resource_id,
+            "resource_name": resource.resource_name,
+            "resource_type": resource.resource_type,
+            "total_hours": round(total_hours, 2)
+        })
+        # combined list of upcoming bookings, grouped by resource
+        for event in upcoming_by_resource.get(resource.resource_id, []):
+            upcoming.append({
+                "resource_name": resource.resource_name,
+                "event_id": event.event_id,
+                "title": event.title,
+                "start_time": str(event.start_time),
+                "end_time": str(event.end_time)
             })
 
-        # Flatten some upcoming info if you want a combined list as well
-        for r in report_data:
-            for ev in r["upcoming"]:
-                upcoming.append({"resource": r["resource"], "event": ev})
+    return {
+        "start_date": start_str,
+        "end_date": end_str,
+        "report_data": report_data,
+        "upcoming": upcoming
+    }
+
 
+@app.route('/report')
+def utilisation_report():
+    # the page only holds the filter form; report.html fetches the data
+    # from /report.json and renders it in the browser
     return render_template('report.html',
-                           resources=resources,
-                           report_data=report_data,
-                           upcoming=upcoming,
-                           start_date=start_str,
-                           end_date=end_str)
+                           start_date=request.args.get('start_date'),
+                           end_date=request.args.get('end_date'))
+
+
+@app.route('/report.json')
+def utilisation_report_json():
+    start_str = request.args.get('start_date')
+    end_str = request.args.get('end_date')
+
+    if not start_str or not end_str:
+        return jsonify(error="Start date and end date are required."), 400
+
+    try:
+        report = build_utilisation_report(start_str, end_str)
+    except ValueError:
+        return jsonify(error="Dates must be in YYYY-MM-DD format."), 400
+    return jsonify(report)
 
 
 # -------------------
 # DB INIT
 # -------------------
 
+def upgrade_allocation_foreign_keys():
+    """
+    Allocation tables created before the foreign keys had ON DELETE CASCADE
+    keep their old definition, since db.create_all() never alters a table.
+    SQLite can't change a foreign key in place, so rebuild the table from the
+    current model and copy its rows across, in one transaction.
+    """
+    table = EventResourceAllocation.__table__
+    columns = ", ".join(column.name for column in table.columns)
+    raw = db.engine.raw_connection()
+    sqlite_conn = raw.driver_connection
+    isolation_level = sqlite_conn.isolation_level
+    cursor = sqlite_conn.cursor()
+    try:
+        foreign_keys = cursor.execute(f"PRAGMA foreign_key_list({table.name})").fetchall()
+        if all(fk[6] == 'CASCADE' for fk in foreign_keys):  # fk[6] is on_delete
+            return
+
+        # foreign_keys can only be switched outside a transaction, so manage
+        # BEGIN/COMMIT ourselves instead of leaving it to the sqlite3 module
+        sqlite_conn.isolation_level = None
+        cursor.execute("PRAGMA foreign_keys=OFF")
+        cursor.execute("BEGIN")
+        try:
+            cursor.execute(f"ALTER TABLE {table.name} RENAME TO {table.name}_old")
+            # the renamed table keeps its indexes; free the names for the new one
+            for index in table.indexes:
+                cursor.execute(f"DROP INDEX IF EXISTS {index.name}")
+            cursor.execute(str(CreateTable(table).compile(db.engine)))
+            cursor.execute(f"INSERT INTO {table.name} ({columns}) "
+                           f"SELECT {columns} FROM {table.name}_old")
+            cursor.execute(f"DROP TABLE {table.name}_old")
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.execute("PRAGMA foreign_keys=ON")
+    finally:
+        cursor.close()
+        sqlite_conn.isolation_level = isolation_level
+        raw.close()
+
+
+def create_schema():
+    """
+    Create missing tables, bring an old allocation table up to the current
+    foreign keys, then create any indexes missing from tables that already
+    existed (db.create_all() only creates indexes together with a new table).
+    """
+    db.create_all()
+    upgrade_allocation_foreign_keys()
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+
 @app.cli.command('init-db')
 def init_db():
     """Flask CLI command: flask init-db"""
-    db.create_all()
+    create_schema()
     print("Database initialised.")
 
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        create_schema()
     app.run(debug=True)
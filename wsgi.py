@@ -0,0 +1,10 @@
+"""
+WSGI entry point for running under a production server, e.g.
+
+    gunicorn -k gevent -w 4 wsgi:application
+
+Create the database first with `flask init-db`.
+"""
+from app import app
+
+application = app